@@ -0,0 +1,219 @@
+# pgnstudyrelay - Relay moves from a PGN feed into a lichess study
+#
+# Copyright (C) 2017 Lakin Wecker <lakin@wecker.ca>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+__all__ = [
+    "Diagnostics",
+    "SamplingProfiler",
+    "StageTimings",
+    "monitor_lag",
+]
+
+import asyncio
+import os
+import signal
+import sys
+import threading
+import time
+
+from collections import Counter, defaultdict
+
+#-------------------------------------------------------------------------------
+# Per-stage timing spans.
+#-------------------------------------------------------------------------------
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_no_span = _NoSpan()
+
+class _Span:
+    def __init__(self, totals, counts, stage):
+        self.totals = totals
+        self.counts = counts
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.totals[self.stage] += time.perf_counter() - self.start
+        self.counts[self.stage] += 1
+        return False
+
+def _format_stages(totals, counts):
+    return ", ".join(
+        "{} {:.1f}ms ({})".format(stage, total * 1000, counts[stage])
+        for stage, total in totals.items()
+    )
+
+class StageTimings:
+    """Accumulates wall time spent in named stages until the next report.
+
+    span() is for stages that never await, so their time is this relay's own
+    CPU. wait() is for stages that await lichess. Those are reported apart,
+    because while they wait the loop runs whatever else is ready, including
+    the other relays in a worker, and that time lands in the span too.
+
+    When disabled, both hand back a shared no-op context manager so the
+    instrumented code pays for little more than the method call.
+    """
+    #---------------------------------------------------------------------------
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.wait_totals = defaultdict(float)
+        self.wait_counts = defaultdict(int)
+
+    #---------------------------------------------------------------------------
+    def span(self, stage):
+        if not self.enabled:
+            return _no_span
+        return _Span(self.totals, self.counts, stage)
+
+    #---------------------------------------------------------------------------
+    def wait(self, stage):
+        if not self.enabled:
+            return _no_span
+        return _Span(self.wait_totals, self.wait_counts, stage)
+
+    #---------------------------------------------------------------------------
+    def report(self, label):
+        if not self.enabled or not (self.totals or self.wait_totals):
+            return
+        print("%% [TIMING] {}: cpu: {} | awaited, includes other tasks: {}".format(
+            label,
+            _format_stages(self.totals, self.counts) or "-",
+            _format_stages(self.wait_totals, self.wait_counts) or "-",
+        ))
+        self.totals.clear()
+        self.counts.clear()
+        self.wait_totals.clear()
+        self.wait_counts.clear()
+
+#-------------------------------------------------------------------------------
+# Event loop lag.
+#-------------------------------------------------------------------------------
+async def monitor_lag(loop, threshold, interval=1):
+    """Report whenever a timer fires more than threshold seconds late.
+
+    This is the same kind of timer as the websocket ping, so a lagging report
+    here means pings and everything else scheduled on the loop are late too.
+    """
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = loop.time() - expected
+        if lag > threshold:
+            print("%% [LAG] pid {}: event loop timer fired {:.0f}ms late".format(
+                os.getpid(),
+                lag * 1000,
+            ))
+
+#-------------------------------------------------------------------------------
+# Sampling profiler.
+#-------------------------------------------------------------------------------
+class SamplingProfiler:
+    """Samples the stack of one thread from a background thread.
+
+    Profiles are written in the collapsed stack format understood by
+    flamegraph.pl and speedscope, one file per run.
+    """
+    #---------------------------------------------------------------------------
+    def __init__(self, directory, seconds=10, interval=0.005, thread_id=None):
+        self.directory = directory
+        self.seconds = seconds
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.thread = None
+
+    #---------------------------------------------------------------------------
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            print("%% [PROFILE] a profile is already running")
+            return
+        print("%% [PROFILE] sampling for {}s".format(self.seconds))
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    #---------------------------------------------------------------------------
+    def _run(self):
+        stacks = self.sample()
+        path = os.path.join(self.directory, "profile-{}-{}.txt".format(
+            os.getpid(),
+            time.strftime("%Y%m%d-%H%M%S"),
+        ))
+        try:
+            with open(path, "w") as output:
+                for stack, count in stacks.most_common():
+                    output.write("{} {}\n".format(stack, count))
+        except OSError as e:
+            print("%% [PROFILE] unable to write {}: {}".format(path, e))
+            return
+        print("%% [PROFILE] wrote {} samples to {}".format(sum(stacks.values()), path))
+
+    #---------------------------------------------------------------------------
+    def sample(self):
+        stacks = Counter()
+        deadline = time.monotonic() + self.seconds
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append("{} ({}:{})".format(
+                    code.co_name,
+                    os.path.basename(code.co_filename),
+                    frame.f_lineno,
+                ))
+                frame = frame.f_back
+            stacks[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+        return stacks
+
+#-------------------------------------------------------------------------------
+class Diagnostics:
+    """The diagnostics requested on the command line.
+
+    Plain attributes only until install() is called, so it can be handed to
+    worker processes.
+    """
+    #---------------------------------------------------------------------------
+    def __init__(self, lag_threshold=None, profile_dir=None, profile_seconds=10, timings=False):
+        self.lag_threshold = lag_threshold
+        self.profile_dir = profile_dir
+        self.profile_seconds = profile_seconds
+        self.timings = timings
+
+    #---------------------------------------------------------------------------
+    def stage_timings(self):
+        return StageTimings(enabled=self.timings)
+
+    #---------------------------------------------------------------------------
+    def install(self, loop):
+        """Start the lag monitor and the SIGUSR1 profile trigger on this loop."""
+        if self.lag_threshold is not None:
+            asyncio.ensure_future(monitor_lag(loop, self.lag_threshold), loop=loop)
+        if self.profile_dir is not None:
+            profiler = SamplingProfiler(self.profile_dir, seconds=self.profile_seconds)
+            loop.add_signal_handler(signal.SIGUSR1, profiler.start)
@@ -18,7 +18,10 @@
 __all__ = [
     "Lichess",
     "LoginError",
-    "StudyConnectionError"
+    "LoginRejectedError",
+    "StudyConnectionError",
+    "StudyNotAContributor",
+    "UnsupportedURLError",
     "move_to_path_id",
     "clock_from_comment",
     "clock_from_seconds",
@@ -45,12 +48,18 @@ from chess import PIECE_SYMBOLS, SQUARES, square_file, square_rank
 class LoginError(RuntimeError):
     pass
 
+class LoginRejectedError(LoginError):
+    pass
+
 class StudyConnectionError(RuntimeError):
     pass
 
 class StudyNotAContributor(RuntimeError):
     pass
 
+class UnsupportedURLError(RuntimeError):
+    pass
+
 #-------------------------------------------------------------------------------
 # Some useful constants
 #-------------------------------------------------------------------------------
@@ -326,7 +335,7 @@ class Study:
         })
 
     #---------------------------------------------------------------------------
-    async def add_move(self, chapter_id, path,new_node, old_node):
+    async def add_move(self, chapter_id, path,new_node, old_node, board=None):
         promotion_lookup = {
             "q": "queen",
             "r": "rook",
@@ -334,13 +343,17 @@ class Study:
             "n": "knight",
             "k": "king",
         }
-        uci = old_node.board().uci(new_node.move, chess960=True)
+        # Node.board() replays the game from the start, so callers that
+        # already have the position can pass it in.
+        if board is None:
+            board = old_node.board()
+        uci = board.uci(new_node.move, chess960=True)
         move = {
             "t":"anaMove",
             "d":{
                 "orig": uci[:2],
                 "dest": uci[2:4],
-                "fen": old_node.board().fen(),
+                "fen": board.fen(),
                 "path": path,
                 "ch": chapter_id,
                 "sticky": False,
@@ -391,7 +404,7 @@ class Lichess:
     #---------------------------------------------------------------------------
     def __init__(self, loop, session, url, log_ws=False):
         if url not in [STAGING_URL, LIVE_URL]:
-            raise RuntimeError("{} is not one of {} or {}".format(
+            raise UnsupportedURLError("{} is not one of {} or {}".format(
                 url,
                 LIVE_URL,
                 STAGING_URL,
@@ -415,7 +428,8 @@ class Lichess:
     async def login(self, username, password):
         """Login to lichess using the given credentials.
 
-        Raises LoginError if the login is unsuccessful
+        Raises LoginRejectedError if lichess turns the credentials down, and
+        LoginError for any other unsuccessful response.
         """
         self.username = username
         response = await self.session.post(
@@ -423,8 +437,10 @@ class Lichess:
             headers=headers,
             data={"username": username, "password": password}
         )
+        if 400 <= response.status < 500 and response.status != 429:
+            raise LoginRejectedError("Lichess rejected the login with {}".format(response.status))
         if response.status != 200:
-            raise LoginError("Unable to login")
+            raise LoginError("Unable to login, lichess returned {}".format(response.status))
 
     #---------------------------------------------------------------------------
     async def study(self, study_id):
@@ -22,21 +22,29 @@ import asyncio
 import aiohttp
 import chess
 import chess.pgn
+import functools
 import glob
 from io import StringIO
+import multiprocessing
+import os
+import sys
+import threading
 import time
 from urllib.parse import urlparse
 
 from collections import defaultdict
 
+from diagnostics import Diagnostics, StageTimings
 from lichess import (
     clock_from_comment,
     clock_from_seconds,
     move_to_path_id,
     Lichess,
     LoginError,
+    LoginRejectedError,
     StudyConnectionError,
     StudyNotAContributor,
+    UnsupportedURLError,
 )
 
 def game_key_from_tags(tags):
@@ -66,8 +74,9 @@ def game_title_from_game(game):
     return game_title_from_tags(game.headers)
 
 class PGNStudyRelay:
-    def __init__(self, study):
+    def __init__(self, study, timings=None):
         self.study = study
+        self.timings = timings or StageTimings()
         self.pgns_by_key = defaultdict(str)
         self.chapter_versions_by_key = defaultdict(str)
 
@@ -75,14 +84,16 @@ class PGNStudyRelay:
         handle = StringIO(contents)
         chapters_created = False
         while True:
-            game = chess.pgn.read_game(handle)
+            with self.timings.span("parse"):
+                game = chess.pgn.read_game(handle)
             if game is None: break
 
             game.key = game_key_from_game(game)
             game.title = game_title_from_game(game)
 
-            chapter_lookup = {game_key_from_chapter(c): c for c in self.study.get_chapters()}
-            chapter = chapter_lookup.get(game.key)
+            with self.timings.span("lookup"):
+                chapter_lookup = {game_key_from_chapter(c): c for c in self.study.get_chapters()}
+                chapter = chapter_lookup.get(game.key)
 
             if not chapter:
                 print("++ [SYNCING] inserting new chapter for: {}".format(game.title))
@@ -109,45 +120,46 @@ class PGNStudyRelay:
 
             has_new_moves = False
 
-            tree_parts = chapter['analysis']['treeParts']
-            tree_len = len(tree_parts)
-            tree_index = 1
-            path = ""
-            prev_node = game
-            cur_node = game.variations[0]
-            if tree_len > 1:
-                tree_node = tree_parts[tree_index]
-
-                while True:
-                    if tree_node['san'] != cur_node.san():
-                        has_new_moves = True
-                        break
-
-                    #clock = clock_from_comment(cur_node.comment)
-                    #tree_clock = clock_from_seconds(tree_node.get('clock', 0))
-                    #if clock != tree_clock:
-                        #print("{} vs {}->{}".format(clock, tree_node.get('clock'), tree_clock))
-                        #has_new_moves = True
-                        #break
-
-                    # if we're at the end of the incoming moves we're done.
-                    if cur_node.is_end(): break
-
-                    # The moves were the same, update iterator for incoming moves
-                    # and the path
-                    path += tree_node['id']
-                    prev_node = cur_node
-                    cur_node = cur_node.variations[0]
-
-                    # We're done with the chapter moves, but not the incoming moves
-                    if tree_index+1 == tree_len:
-                        has_new_moves = True
-                        break
-
-                    tree_index += 1
+            with self.timings.span("walk"):
+                tree_parts = chapter['analysis']['treeParts']
+                tree_len = len(tree_parts)
+                tree_index = 1
+                path = ""
+                prev_node = game
+                cur_node = game.variations[0]
+                if tree_len > 1:
                     tree_node = tree_parts[tree_index]
-            else:
-                has_new_moves = True
+
+                    while True:
+                        if tree_node['san'] != cur_node.san():
+                            has_new_moves = True
+                            break
+
+                        #clock = clock_from_comment(cur_node.comment)
+                        #tree_clock = clock_from_seconds(tree_node.get('clock', 0))
+                        #if clock != tree_clock:
+                            #print("{} vs {}->{}".format(clock, tree_node.get('clock'), tree_clock))
+                            #has_new_moves = True
+                            #break
+
+                        # if we're at the end of the incoming moves we're done.
+                        if cur_node.is_end(): break
+
+                        # The moves were the same, update iterator for incoming moves
+                        # and the path
+                        path += tree_node['id']
+                        prev_node = cur_node
+                        cur_node = cur_node.variations[0]
+
+                        # We're done with the chapter moves, but not the incoming moves
+                        if tree_index+1 == tree_len:
+                            has_new_moves = True
+                            break
+
+                        tree_index += 1
+                        tree_node = tree_parts[tree_index]
+                else:
+                    has_new_moves = True
 
             if has_new_moves:
                 while True:
@@ -159,23 +171,29 @@ class PGNStudyRelay:
                         break
 
                     print("++ [SYNCING] New move in {}: {}".format(game.title, cur_node.move.uci()))
-                    await self.study.add_move(chapter['id'], path, cur_node, prev_node)
-                    path += move_to_path_id(prev_node.board()._to_chess960(cur_node.move))
+                    with self.timings.span("replay"):
+                        board = prev_node.board()
+                    with self.timings.wait("send"):
+                        await self.study.add_move(chapter['id'], path, cur_node, prev_node, board)
+                    path += move_to_path_id(board._to_chess960(cur_node.move))
                     if cur_node.is_end():
                         break
 
                     prev_node = cur_node
                     cur_node = cur_node.variations[0]
                     await asyncio.sleep(0.5) # TODO:  This could be smarter.
-                await self.study.sync_chapter(chapter['id'])
+                with self.timings.wait("sync"):
+                    await self.study.sync_chapter(chapter['id'])
 
             incoming_result = game.headers['Result']
             if incoming_result != "*":
                 if chapter['tags']['Result'] != incoming_result and cur_node.is_end():
-                    await self.study.set_tag(chapter['id'], 'Result', game.headers['Result'])
-                    await self.study.set_move_comment(chapter['id'], path, "Game ended in: {}".format(incoming_result))
-                    await self.study.talk("{} ended in: {}".format(game.title, incoming_result))
-                    await self.study.sync_chapter(chapter['id'])
+                    with self.timings.wait("send"):
+                        await self.study.set_tag(chapter['id'], 'Result', game.headers['Result'])
+                        await self.study.set_move_comment(chapter['id'], path, "Game ended in: {}".format(incoming_result))
+                        await self.study.talk("{} ended in: {}".format(game.title, incoming_result))
+                    with self.timings.wait("sync"):
+                        await self.study.sync_chapter(chapter['id'])
 
         if chapters_created:
             # TODO: there has to be a better way to do this. But at the moment
@@ -185,41 +203,448 @@ class PGNStudyRelay:
             print("-- [SYNCING] Syncing study because we created chapters")
             await self.study.sync()
 
-async def poll_files(relay, directory, delay):
+        self.timings.report(self.study.study_id)
+
+async def poll_files(sync, directory, delay):
     files = sorted(glob.glob("{}/*.pgn".format(directory)))
     for file in files:
         print("~~ [POLLING] {}".format(file))
         contents = open(file, "r").read()
-        await relay.sync_with_pgn(contents)
+        await sync(contents)
         await asyncio.sleep(delay)
 
-async def poll_url(relay, url, delay):
-    async with aiohttp.ClientSession(loop=loop) as session:
+async def poll_url(sync, url, delay):
+    async with aiohttp.ClientSession() as session:
         while True:
             url_with_buster = "{}?v={}".format(url, time.time())
             print("~~ [POLLING] {}".format(url_with_buster))
             response = await session.get(url_with_buster)
             body = await response.read()
-            await relay.sync_with_pgn(body.decode("ISO-8859-1"))
+            await sync(body.decode("ISO-8859-1"))
             await asyncio.sleep(delay)
 
+def is_url_feed(url):
+    return url.startswith('http://') or url.startswith('https://')
+
+async def poll_feed(sync, url, delay):
+    if is_url_feed(url):
+        print("Polling URL: {}".format(url))
+        await poll_url(sync, url, delay)
+    else:
+        print("~~ [POLLING] processing {}".format(url))
+        await poll_files(sync, url, delay)
+
+def split_study_url(study_url):
+    components = urlparse(study_url)
+    base_url = "{}://{}/".format(components.scheme, components.netloc)
+    study_id = study_url.split("/")[-1]
+    return base_url, study_id
+
+#-------------------------------------------------------------------------------
+# Sharding (study, feed) relays across worker processes.
+#
+# The supervisor downloads each distinct feed once and broadcasts every body
+# down a pipe to the workers that relay it. Each worker runs its own event loop
+# and lichess session, so the parsing and board replays for different studies
+# happen on different cores.
+#-------------------------------------------------------------------------------
+FATAL_EXIT_CODE = 2
+
+async def relay_worker(loop, feeds_conn, status_conn, username, password, relays, log_ws, diagnostics):
+    diagnostics.install(loop)
+
+    # Each PGN is a full snapshot of the feed, so only the latest body per
+    # feed is kept. A relay that falls behind skips straight to it.
+    latest_by_feed = {}
+    relays_by_study = []
+    stopping = False
+
+    def receive():
+        nonlocal stopping
+        try:
+            while feeds_conn.poll():
+                message = feeds_conn.recv()
+                if message[0] == "stop":
+                    stopping = True
+                    break
+                _, feed, contents = message
+                sequence, _ = latest_by_feed.get(feed, (0, None))
+                latest_by_feed[feed] = (sequence + 1, contents)
+        except EOFError:
+            stopping = True
+        if stopping:
+            loop.remove_reader(feeds_conn.fileno())
+        for _, _, _, arrived in relays_by_study:
+            arrived.set()
+
+    async def consume(study_url, feed, relay, arrived):
+        synced_sequence = 0
+        while True:
+            if not stopping:
+                await arrived.wait()
+                arrived.clear()
+            if relay.study.should_stop:
+                raise RuntimeError("Lost the websocket connection to {}".format(study_url))
+            sequence, contents = latest_by_feed.get(feed, (0, None))
+            if sequence == synced_sequence:
+                if stopping:
+                    return
+                continue
+            synced_sequence = sequence
+            await relay.sync_with_pgn(contents)
+            status_conn.send(("status", study_url, "synced"))
+
+    # Keep draining the supervisor's pipe while we log in and connect.
+    loop.add_reader(feeds_conn.fileno(), receive)
+
+    async with aiohttp.ClientSession(loop=loop) as session:
+        lichess_by_base_url = {}
+        login_errors_by_base_url = {}
+        for study_url, feed in relays:
+            base_url, study_id = split_study_url(study_url)
+            try:
+                if base_url in login_errors_by_base_url:
+                    raise login_errors_by_base_url[base_url]
+                lichess = lichess_by_base_url.get(base_url)
+                if lichess is None:
+                    lichess = Lichess(loop, session, base_url, log_ws=log_ws)
+                    try:
+                        await lichess.login(username, password)
+                    except LoginRejectedError as e:
+                        login_errors_by_base_url[base_url] = e
+                        raise
+                    lichess_by_base_url[base_url] = lichess
+                study = await lichess.study(study_id)
+                study.ensure_contributor()
+            except (UnsupportedURLError, LoginRejectedError, StudyNotAContributor) as e:
+                # A restart won't fix these, so drop this study and keep
+                # relaying the rest of the shard. Any other LoginError or a
+                # StudyConnectionError may just be lichess having a bad minute,
+                # so those crash the worker and get retried.
+                status_conn.send(("fatal", study_url, "{}: {}".format(type(e).__name__, e)))
+                continue
+            # Start set, so anything received while connecting gets synced.
+            arrived = asyncio.Event()
+            arrived.set()
+            relays_by_study.append((study_url, feed, PGNStudyRelay(study, diagnostics.stage_timings()), arrived))
+            status_conn.send(("status", study_url, "connected"))
+
+        if not relays_by_study:
+            return FATAL_EXIT_CODE
+
+        await asyncio.gather(*[consume(*relay) for relay in relays_by_study])
+
+def run_worker(feeds_conn, status_conn, username, password, relays, log_ws, diagnostics):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    sys.exit(loop.run_until_complete(
+        relay_worker(loop, feeds_conn, status_conn, username, password, relays, log_ws, diagnostics)
+    ))
+
+class FeedWriter:
+    """Sends feeds down a pipe to one worker from a background thread.
+
+    Connection.send blocks once the pipe is full, which a big event PGN does on
+    its own, so it must not run on the supervisor's loop. Only the newest body
+    per feed waits to be sent; a worker that isn't reading just skips ahead.
+    """
+    def __init__(self, conn):
+        self.conn = conn
+        self.pending = {}
+        self.stop = False
+        self.closed = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def send_pgn(self, feed, contents):
+        with self.condition:
+            self.pending[feed] = contents
+            self.condition.notify()
+
+    def send_stop(self):
+        with self.condition:
+            self.stop = True
+            self.condition.notify()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+    def _run(self):
+        try:
+            while True:
+                with self.condition:
+                    while not (self.pending or self.stop or self.closed):
+                        self.condition.wait()
+                    if self.closed:
+                        return
+                    pending, self.pending = self.pending, {}
+                    stop, self.stop = self.stop, False
+                for feed, contents in pending.items():
+                    self.conn.send(("pgn", feed, contents))
+                if stop:
+                    self.conn.send(("stop",))
+        except OSError:
+            # The worker died, monitor() will notice and restart it.
+            pass
+        finally:
+            self.conn.close()
+
+class RelayWorker:
+    def __init__(self, index, relays):
+        self.index = index
+        self.relays = relays
+        self.feeds = {feed for _, feed in relays}
+        self.process = None
+        self.conn = None
+        self.writer = None
+        self.crashes = 0
+        self.restart_at = None
+        self.finished = False
+
+    def state(self):
+        if self.finished:
+            return "finished"
+        if self.restart_at is not None:
+            return "restarting in {:.0f}s".format(self.restart_at - time.time())
+        return "running (pid {}, {} restarts)".format(self.process.pid, self.crashes)
+
+class RelaySupervisor:
+    def __init__(self, loop, username, password, relays, workers,
+            poll_delay=1, status_interval=30, log_ws=False, diagnostics=None):
+        self.loop = loop
+        self.username = username
+        self.password = password
+        self.poll_delay = poll_delay
+        self.status_interval = status_interval
+        self.log_ws = log_ws
+        self.diagnostics = diagnostics or Diagnostics()
+        self.context = multiprocessing.get_context("spawn")
+        self.worker_target = run_worker
+
+        shards = [[] for _ in range(min(workers, len(relays)))]
+        for index, relay in enumerate(relays):
+            shards[index % len(shards)].append(relay)
+        self.workers = [RelayWorker(index, shard) for index, shard in enumerate(shards)]
+
+        self.feeds = list(dict.fromkeys(feed for _, feed in relays))
+        self.latest_by_feed = {}
+        self.poll_failures_by_feed = defaultdict(int)
+        self.status_by_study = {study_url: ("starting", time.time()) for study_url, _ in relays}
+        self.failed_studies = set()
+        self.stopping = False
+
+    def start_worker(self, worker):
+        relays = [relay for relay in worker.relays if relay[0] not in self.failed_studies]
+        if not relays:
+            worker.finished = True
+            return
+        child_feeds_conn, feeds_conn = self.context.Pipe(duplex=False)
+        status_conn, child_status_conn = self.context.Pipe(duplex=False)
+        worker.process = self.context.Process(
+            target=self.worker_target,
+            args=(child_feeds_conn, child_status_conn, self.username, self.password, relays, self.log_ws, self.diagnostics),
+            daemon=True,
+        )
+        worker.process.start()
+        child_feeds_conn.close()
+        child_status_conn.close()
+        worker.writer = FeedWriter(feeds_conn)
+        worker.conn = status_conn
+        self.loop.add_reader(status_conn.fileno(), self.receive, worker)
+        print("** [SUPERVISOR] started worker#{} (pid {}) for {} relays".format(
+            worker.index,
+            worker.process.pid,
+            len(relays),
+        ))
+
+        # A restarted worker has to catch up with what the others already have.
+        for feed in worker.feeds:
+            if feed in self.latest_by_feed:
+                worker.writer.send_pgn(feed, self.latest_by_feed[feed])
+        if self.stopping:
+            worker.writer.send_stop()
+
+    def detach(self, worker):
+        if worker.conn is None:
+            return
+        self.loop.remove_reader(worker.conn.fileno())
+        worker.conn.close()
+        worker.conn = None
+        worker.writer.close()
+
+    def receive(self, worker):
+        try:
+            while worker.conn.poll():
+                kind, study_url, text = worker.conn.recv()
+                self.status_by_study[study_url] = (text, time.time())
+                if kind == "fatal":
+                    print("!! [SUPERVISOR] worker#{} gave up on {}: {}".format(worker.index, study_url, text))
+                    self.failed_studies.add(study_url)
+                elif text == "synced":
+                    worker.crashes = 0
+        except (EOFError, OSError):
+            self.detach(worker)
+
+    async def broadcast(self, feed, contents):
+        self.latest_by_feed[feed] = contents
+        self.poll_failures_by_feed[feed] = 0
+        for worker in self.workers:
+            if feed in worker.feeds and worker.conn is not None:
+                worker.writer.send_pgn(feed, contents)
+
+    async def poll(self, feed):
+        while True:
+            try:
+                await poll_feed(functools.partial(self.broadcast, feed), feed, self.poll_delay)
+                return
+            except (aiohttp.ClientError, OSError, asyncio.TimeoutError) as e:
+                # One flaky feed shouldn't take every relay down with it. A
+                # directory that can't be read won't get better though, and
+                # retrying it would replay every earlier file.
+                if not is_url_feed(feed):
+                    raise
+                delay = min(2 ** self.poll_failures_by_feed[feed], 60)
+                self.poll_failures_by_feed[feed] += 1
+                print("!! [POLLING] {} failed ({}: {}), retrying in {}s".format(
+                    feed,
+                    type(e).__name__,
+                    e,
+                    delay,
+                ))
+                await asyncio.sleep(delay)
+
+    def check_worker(self, worker):
+        if worker.finished or worker.process.is_alive():
+            return
+        self.detach(worker)
+        exitcode = worker.process.exitcode
+        if exitcode == FATAL_EXIT_CODE or (exitcode == 0 and self.stopping):
+            worker.finished = True
+        elif worker.restart_at is None:
+            delay = min(2 ** worker.crashes, 60)
+            worker.crashes += 1
+            worker.restart_at = time.time() + delay
+            print("!! [SUPERVISOR] worker#{} exited with {}, restarting in {}s".format(
+                worker.index,
+                exitcode,
+                delay,
+            ))
+        elif time.time() >= worker.restart_at:
+            worker.restart_at = None
+            self.start_worker(worker)
+
+    def print_status(self):
+        now = time.time()
+        for worker in self.workers:
+            print("** [STATUS] worker#{}: {}".format(worker.index, worker.state()))
+            for study_url, _ in worker.relays:
+                state, when = self.status_by_study[study_url]
+                print("** [STATUS]     {}: {} {:.0f}s ago".format(study_url, state, now - when))
+
+    async def monitor(self):
+        last_status = time.time()
+        while not all(worker.finished for worker in self.workers):
+            for worker in self.workers:
+                self.check_worker(worker)
+            if time.time() - last_status >= self.status_interval:
+                self.print_status()
+                last_status = time.time()
+            await asyncio.sleep(1)
+        self.print_status()
+
+    async def run(self):
+        self.diagnostics.install(self.loop)
+        for worker in self.workers:
+            self.start_worker(worker)
+
+        monitor = asyncio.ensure_future(self.monitor())
+        polling = asyncio.ensure_future(asyncio.gather(*[self.poll(feed) for feed in self.feeds]))
+        try:
+            await asyncio.wait([monitor, polling], return_when=asyncio.FIRST_COMPLETED)
+
+            # Every worker failed for good, there's nobody left to relay to.
+            if monitor.done():
+                return
+            if polling.exception() is not None:
+                raise polling.exception()
+
+            # Network errors are retried, so only directory feeds run out. Let
+            # the workers finish what they have.
+            self.stopping = True
+            for worker in self.workers:
+                if worker.conn is not None:
+                    worker.writer.send_stop()
+            await monitor
+        finally:
+            monitor.cancel()
+            polling.cancel()
+            await asyncio.gather(monitor, polling, return_exceptions=True)
+
 async def main(loop):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("username", help="A lichess username")
+    parser.add_argument("password", help="The password for that username")
+    parser.add_argument("study_url", nargs="?", help="The study URL where the moves should be relayed. NOTE: the user must have contributor access")
+    parser.add_argument("url", nargs="?", help="A PGN url that will be polled, or a directory containing already polled PGN files.")
+    parser.add_argument("--relay", nargs=2, action="append", default=[], metavar=("STUDY_URL", "URL"), help="Another study URL and PGN url pair to relay. May be given more than once")
+    parser.add_argument("--workers", type=int, default=1, help="The number of worker processes to shard the relays across")
+    parser.add_argument("--status_interval", type=float, default=30, help="The time to wait (in seconds) between worker status reports")
+    parser.add_argument("--poll_delay", type=float, default=1, help="The time to wait (in seconds) between polling. Accepts floats")
+    parser.add_argument("--log_ws", type=bool, default=False, help="Log websocket messages")
+    parser.add_argument("--lag_threshold", type=float, default=None, help="Report whenever an event loop timer fires more than this many seconds late")
+    parser.add_argument("--profile_dir", default=None, help="Write a sampling profile into this directory whenever a process receives SIGUSR1")
+    parser.add_argument("--profile_seconds", type=float, default=10, help="The time to sample (in seconds) for each SIGUSR1 profile")
+    parser.add_argument("--timings", action="store_true", help="Report the time spent parsing, looking up, walking, replaying, sending and syncing for every PGN")
+    args = parser.parse_args()
+
+    if bool(args.study_url) != bool(args.url):
+        parser.error("study_url and url must be given together")
+    relays = [(args.study_url, args.url)] if args.study_url else []
+    relays.extend(tuple(relay) for relay in args.relay)
+    if not relays:
+        parser.error("a study_url and url, or at least one --relay, is required")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.profile_dir is not None:
+        # Profiles are only written after sampling, so find out now.
+        try:
+            os.makedirs(args.profile_dir, exist_ok=True)
+        except OSError as e:
+            parser.error("unable to create --profile_dir: {}".format(e))
+        if not os.access(args.profile_dir, os.W_OK):
+            parser.error("--profile_dir {} is not writable".format(args.profile_dir))
+
+    username = args.username
+    password = args.password
+    diagnostics = Diagnostics(
+        lag_threshold=args.lag_threshold,
+        profile_dir=args.profile_dir,
+        profile_seconds=args.profile_seconds,
+        timings=args.timings,
+    )
+
+    if len(relays) > 1 or args.workers > 1:
+        supervisor = RelaySupervisor(
+            loop,
+            username,
+            password,
+            relays,
+            args.workers,
+            poll_delay=args.poll_delay,
+            status_interval=args.status_interval,
+            log_ws=args.log_ws,
+            diagnostics=diagnostics,
+        )
+        await supervisor.run()
+        return
+
+    diagnostics.install(loop)
     async with aiohttp.ClientSession(loop=loop) as session:
-        parser = argparse.ArgumentParser()
-        parser.add_argument("username", help="A lichess username")
-        parser.add_argument("password", help="The password for that username")
-        parser.add_argument("study_url", help="The study URL where the moves should be relayed. NOTE: the user must have contributor access")
-        parser.add_argument("url", help="A PGN url that will be polled, or a directory containing already polled PGN files.")
-        parser.add_argument("--poll_delay", type=float, default=1, help="The time to wait (in seconds) between polling. Accepts floats")
-        parser.add_argument("--log_ws", type=bool, default=False, help="Log websocket messages")
-        args = parser.parse_args()
-
-        username = args.username
-        password = args.password
-
-        study_url = args.study_url
-        components = urlparse(study_url)
-        base_url = "{}://{}/".format(components.scheme, components.netloc)
+        study_url, url = relays[0]
+        base_url, study_id = split_study_url(study_url)
         lichess = Lichess(loop, session, base_url, log_ws=args.log_ws)
         try:
             await lichess.login(username, password)
@@ -227,7 +652,6 @@ async def main(loop):
             print("Unable to login to lichess successfully. Please check your credentials")
             return
 
-        study_id = study_url.split("/")[-1]
         try:
             study = await lichess.study(study_id)
             study.ensure_contributor()
@@ -238,16 +662,8 @@ async def main(loop):
             print("The provided user is not a contributor to the study.")
             return
 
-        relay = PGNStudyRelay(study)
-
-        url = args.url
-        poll = None
-        if url.startswith('http://') or url.startswith('https://'):
-            print("Polling URL: {}".format(url))
-            await poll_url(relay, url, args.poll_delay)
-        else:
-            print("~~ [POLLING] processing {}".format(url))
-            await poll_files(relay, url, args.poll_delay)
+        relay = PGNStudyRelay(study, diagnostics.stage_timings())
+        await poll_feed(relay.sync_with_pgn, url, args.poll_delay)
 
 if __name__ == '__main__':
     loop = asyncio.get_event_loop()
@@ -0,0 +1,67 @@
+import asyncio
+import os
+import time
+
+import diagnostics
+from diagnostics import SamplingProfiler, StageTimings, monitor_lag
+
+#-------------------------------------------------------------------------------
+def test_disabled_timings_hand_out_the_shared_no_op(capsys):
+    timings = StageTimings()
+
+    assert timings.span("parse") is diagnostics._no_span
+    assert timings.wait("sync") is diagnostics._no_span
+    with timings.span("parse"), timings.wait("sync"):
+        pass
+    timings.report("study")
+
+    assert capsys.readouterr().out == ""
+
+def test_enabled_timings_report_cpu_and_awaited_stages_apart(capsys):
+    timings = StageTimings(enabled=True)
+
+    with timings.span("parse"):
+        pass
+    with timings.span("parse"):
+        pass
+    with timings.wait("sync"):
+        pass
+
+    assert timings.counts == {"parse": 2}
+    assert timings.wait_counts == {"sync": 1}
+    timings.report("study")
+    out = capsys.readouterr().out
+    assert out.startswith("%% [TIMING] study: cpu: parse ")
+    assert "| awaited, includes other tasks: sync " in out
+
+    assert not (timings.totals or timings.counts or timings.wait_totals or timings.wait_counts)
+    timings.report("study")
+    assert capsys.readouterr().out == ""
+
+def test_monitor_lag_reports_a_blocked_loop(capsys):
+    loop = asyncio.new_event_loop()
+    try:
+        monitor = loop.create_task(monitor_lag(loop, 0.05, interval=0.1))
+        loop.call_later(0.02, time.sleep, 0.3)
+        loop.run_until_complete(asyncio.sleep(0.5))
+        monitor.cancel()
+    finally:
+        loop.close()
+
+    out = capsys.readouterr().out
+    assert "%% [LAG] pid {}: event loop timer fired".format(os.getpid()) in out
+
+def test_sampling_profiler_writes_collapsed_stacks(tmp_path):
+    profiler = SamplingProfiler(str(tmp_path), seconds=0.1, interval=0.001)
+
+    profiler.start()
+    profiler.thread.join()
+
+    [profile] = tmp_path.iterdir()
+    assert profile.name.startswith("profile-{}-".format(os.getpid()))
+    lines = profile.read_text().splitlines()
+    assert lines
+    for line in lines:
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0
+        assert "test_sampling_profiler_writes_collapsed_stacks (test_diagnostics.py:" in stack
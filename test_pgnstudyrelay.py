@@ -0,0 +1,283 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+import sys
+import time
+
+import pytest
+
+import pgnstudyrelay
+from diagnostics import Diagnostics
+from lichess import LoginError, LoginRejectedError, StudyNotAContributor
+from pgnstudyrelay import FATAL_EXIT_CODE, FeedWriter, RelaySupervisor, relay_worker
+
+#-------------------------------------------------------------------------------
+# Stand-ins for run_worker. They speak the same pipe protocol but echo each
+# feed body back as the study's status instead of relaying it to lichess.
+#-------------------------------------------------------------------------------
+def echo_worker(feeds_conn, status_conn, username, password, relays, log_ws, diagnostics):
+    for study_url, _ in relays:
+        status_conn.send(("status", study_url, "connected"))
+    while True:
+        try:
+            message = feeds_conn.recv()
+        except EOFError:
+            return
+        if message[0] == "stop":
+            return
+        _, feed, contents = message
+        for study_url, relay_feed in relays:
+            if relay_feed == feed:
+                status_conn.send(("status", study_url, contents))
+
+def crash_once_worker(marker, feeds_conn, status_conn, *args):
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        feeds_conn.recv()
+        os._exit(1)
+    echo_worker(feeds_conn, status_conn, *args)
+
+def failing_study_worker(feeds_conn, status_conn, username, password, relays, log_ws, diagnostics):
+    good = []
+    for study_url, feed in relays:
+        if "bad" in study_url:
+            status_conn.send(("fatal", study_url, "StudyNotAContributor: nope"))
+        else:
+            good.append((study_url, feed))
+    if not good:
+        sys.exit(FATAL_EXIT_CODE)
+    echo_worker(feeds_conn, status_conn, username, password, good, log_ws, diagnostics)
+
+#-------------------------------------------------------------------------------
+# Stand-ins for Lichess and PGNStudyRelay, so relay_worker itself can be driven
+# through real pipes without talking to lichess.
+#-------------------------------------------------------------------------------
+class FakeStudy:
+    def __init__(self, study_id):
+        self.study_id = study_id
+        self.should_stop = False
+
+    def ensure_contributor(self):
+        if "bad" in self.study_id:
+            raise StudyNotAContributor("The user must be a contributor to the study")
+
+class FakeLichess:
+    logins = []
+
+    def __init__(self, loop, session, url, log_ws=False):
+        self.url = url
+
+    async def login(self, username, password):
+        FakeLichess.logins.append(self.url)
+        await asyncio.sleep(0.05)
+        if password == "wrong":
+            raise LoginRejectedError("Lichess rejected the login with 401")
+        if password == "outage":
+            raise LoginError("Unable to login, lichess returned 502")
+
+    async def study(self, study_id):
+        return FakeStudy(study_id)
+
+class FakeRelay:
+    synced = []
+
+    def __init__(self, study, timings=None):
+        self.study = study
+
+    async def sync_with_pgn(self, contents):
+        FakeRelay.synced.append((self.study.study_id, contents))
+        await asyncio.sleep(0)
+        if contents == "disconnect":
+            self.study.should_stop = True
+
+@pytest.fixture
+def fake_lichess(monkeypatch):
+    FakeLichess.logins = []
+    FakeRelay.synced = []
+    monkeypatch.setattr(pgnstudyrelay, "Lichess", FakeLichess)
+    monkeypatch.setattr(pgnstudyrelay, "PGNStudyRelay", FakeRelay)
+
+def drive_worker(relays, messages, statuses, password="password", close=False):
+    feeds_conn, supervisor_feeds_conn = multiprocessing.Pipe(duplex=False)
+    supervisor_status_conn, status_conn = multiprocessing.Pipe(duplex=False)
+    for message in messages:
+        supervisor_feeds_conn.send(message)
+    if close:
+        supervisor_feeds_conn.close()
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(asyncio.wait_for(
+            relay_worker(loop, feeds_conn, status_conn, "user", password, relays, False, Diagnostics()),
+            10,
+        ))
+    finally:
+        loop.close()
+        status_conn.close()
+        while True:
+            try:
+                statuses.append(supervisor_status_conn.recv())
+            except EOFError:
+                break
+
+LIVE_STUDY = "https://lichess.org/study/{}".format
+
+#-------------------------------------------------------------------------------
+def write_feed(directory, *bodies):
+    directory.mkdir()
+    for index, body in enumerate(bodies):
+        (directory / "{:02d}.pgn".format(index)).write_text(body)
+    return str(directory)
+
+def run_supervisor(relays, workers, target, timeout=30):
+    loop = asyncio.new_event_loop()
+    supervisor = RelaySupervisor(loop, "user", "password", relays, workers, poll_delay=0.01)
+    supervisor.worker_target = target
+    try:
+        loop.run_until_complete(asyncio.wait_for(supervisor.run(), timeout))
+        return supervisor
+    finally:
+        for worker in supervisor.workers:
+            if worker.process is not None and worker.process.is_alive():
+                worker.process.terminate()
+                worker.process.join()
+        loop.close()
+
+#-------------------------------------------------------------------------------
+def test_directory_feeds_are_sharded_and_stop_when_they_run_out(tmp_path):
+    first = write_feed(tmp_path / "first", "a1", "a2")
+    second = write_feed(tmp_path / "second", "b1", "b2", "b3")
+    relays = [("s1", first), ("s2", second), ("s3", first)]
+
+    supervisor = run_supervisor(relays, 2, echo_worker)
+
+    assert [len(worker.relays) for worker in supervisor.workers] == [2, 1]
+    assert all(worker.finished for worker in supervisor.workers)
+    assert all(worker.process.exitcode == 0 for worker in supervisor.workers)
+    assert supervisor.status_by_study["s1"][0] == "a2"
+    assert supervisor.status_by_study["s2"][0] == "b3"
+    assert supervisor.status_by_study["s3"][0] == "a2"
+
+def test_crashed_worker_is_restarted_and_caught_up(tmp_path):
+    feed = write_feed(tmp_path / "feed", "1", "2", "3")
+    target = functools.partial(crash_once_worker, str(tmp_path / "crashed"))
+
+    supervisor = run_supervisor([("s1", feed)], 1, target)
+
+    worker = supervisor.workers[0]
+    assert worker.crashes == 1
+    assert worker.finished
+    assert worker.process.exitcode == 0
+    assert supervisor.status_by_study["s1"][0] == "3"
+
+def test_failed_study_does_not_stop_its_shard(tmp_path):
+    feed = write_feed(tmp_path / "feed", "1", "2")
+    relays = [("bad-study", feed), ("bad-alone", feed), ("good-study", feed)]
+
+    supervisor = run_supervisor(relays, 2, failing_study_worker)
+
+    assert supervisor.failed_studies == {"bad-study", "bad-alone"}
+    assert supervisor.status_by_study["good-study"][0] == "2"
+    assert supervisor.workers[1].process.exitcode == FATAL_EXIT_CODE
+    assert all(worker.crashes == 0 for worker in supervisor.workers)
+
+def test_unreachable_url_feed_is_retried(tmp_path):
+    loop = asyncio.new_event_loop()
+    supervisor = RelaySupervisor(loop, "user", "password", [("s1", "http://127.0.0.1:9/feed.pgn")], 1)
+    supervisor.worker_target = echo_worker
+    try:
+        with pytest.raises(asyncio.TimeoutError):
+            loop.run_until_complete(asyncio.wait_for(supervisor.run(), 2))
+        assert supervisor.poll_failures_by_feed["http://127.0.0.1:9/feed.pgn"] >= 1
+        assert supervisor.workers[0].process.is_alive()
+    finally:
+        supervisor.workers[0].process.terminate()
+        loop.close()
+
+def test_unreadable_directory_feed_is_not_retried(tmp_path):
+    feed = write_feed(tmp_path / "feed", "1")
+    (tmp_path / "feed" / "01.pgn").mkdir()
+
+    with pytest.raises(IsADirectoryError):
+        run_supervisor([("s1", feed)], 1, echo_worker)
+
+def test_feed_writer_keeps_only_the_newest_body_per_feed():
+    reader, writer_conn = multiprocessing.Pipe(duplex=False)
+    writer = FeedWriter(writer_conn)
+    big = "x" * (4 * 1024 * 1024)
+
+    # The big body fills the pipe, so the rest queue up behind it.
+    writer.send_pgn("a", big)
+    time.sleep(0.1)
+    writer.send_pgn("b", "1")
+    writer.send_pgn("b", "2")
+    writer.send_stop()
+
+    assert reader.recv() == ("pgn", "a", big)
+    assert reader.recv() == ("pgn", "b", "2")
+    assert reader.recv() == ("stop",)
+    writer.close()
+
+def test_worker_gives_up_on_studies_whose_login_is_rejected(fake_lichess):
+    relays = [(LIVE_STUDY("one"), "feed"), (LIVE_STUDY("two"), "feed")]
+
+    statuses = []
+    result = drive_worker(relays, [("pgn", "feed", "1"), ("stop",)], statuses, password="wrong")
+
+    assert result == FATAL_EXIT_CODE
+    assert [kind for kind, _, _ in statuses] == ["fatal", "fatal"]
+    assert FakeLichess.logins == ["https://lichess.org/"]
+    assert FakeRelay.synced == []
+
+def test_worker_crashes_on_a_login_outage(fake_lichess):
+    relays = [(LIVE_STUDY("one"), "feed")]
+
+    statuses = []
+    with pytest.raises(LoginError) as error:
+        drive_worker(relays, [("pgn", "feed", "1"), ("stop",)], statuses, password="outage")
+
+    assert not isinstance(error.value, LoginRejectedError)
+    assert statuses == []
+
+def test_worker_skips_ahead_to_the_latest_body_per_feed(fake_lichess):
+    relays = [(LIVE_STUDY("one"), "a"), (LIVE_STUDY("two"), "b")]
+    messages = [("pgn", "a", str(n)) for n in range(1, 6)] + [("pgn", "b", "only"), ("stop",)]
+
+    statuses = []
+    result = drive_worker(relays, messages, statuses)
+
+    assert result is None
+    assert sorted(FakeRelay.synced) == [("one", "5"), ("two", "only")]
+    assert sorted(statuses) == sorted([
+        ("status", LIVE_STUDY("one"), "connected"),
+        ("status", LIVE_STUDY("two"), "connected"),
+        ("status", LIVE_STUDY("one"), "synced"),
+        ("status", LIVE_STUDY("two"), "synced"),
+    ])
+
+def test_worker_drains_and_exits_when_the_supervisor_goes_away(fake_lichess):
+    relays = [(LIVE_STUDY("one"), "a")]
+
+    statuses = []
+    result = drive_worker(relays, [("pgn", "a", "1"), ("pgn", "a", "2")], statuses, close=True)
+
+    assert result is None
+    assert FakeRelay.synced == [("one", "2")]
+
+def test_worker_keeps_relaying_when_a_shard_mate_fails(fake_lichess):
+    relays = [(LIVE_STUDY("bad"), "a"), (LIVE_STUDY("good"), "a")]
+
+    statuses = []
+    result = drive_worker(relays, [("pgn", "a", "1"), ("stop",)], statuses)
+
+    assert result is None
+    assert FakeRelay.synced == [("good", "1")]
+    assert ("fatal", LIVE_STUDY("bad"), "StudyNotAContributor: The user must be a contributor to the study") in statuses
+    assert FakeLichess.logins == ["https://lichess.org/"]
+
+def test_worker_crashes_when_a_study_loses_its_websocket(fake_lichess):
+    relays = [(LIVE_STUDY("one"), "a")]
+
+    statuses = []
+    with pytest.raises(RuntimeError, match="Lost the websocket"):
+        drive_worker(relays, [("pgn", "a", "disconnect"), ("stop",)], statuses)